@@ -0,0 +1,56 @@
+import os
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from urllib.parse import quote_plus
+
+# Load environment variables from the .env file in the project root
+load_dotenv()
+
+# One engine (and connection pool) shared by every caller in the process
+_engine = None
+
+
+def get_sql_engine():
+    """Returns the shared SQLAlchemy engine, creating it on first use."""
+    global _engine
+    if _engine is not None:
+        return _engine
+
+    try:
+        db_password = os.getenv("DB_PASSWORD")
+        if not db_password:
+            raise ValueError("DB_PASSWORD not found in .env file!")
+
+        # Encode the password so special characters don't break the URL
+        safe_password = quote_plus(db_password)
+        db_url = f"postgresql://postgres:{safe_password}" "@localhost:5432/energy_db"
+
+        # 'pool_pre_ping' checks a pooled connection is still alive before
+        # handing it out, and 'pool_recycle' replaces connections after an hour.
+        _engine = create_engine(
+            db_url,
+            pool_size=4,
+            max_overflow=0,
+            pool_recycle=3600,
+            pool_pre_ping=True,
+        )
+        print("Database connection engine created successfully!")
+        return _engine
+    except Exception as e:
+        print(f"Could not create database engine: {e}")
+        return None
+
+
+def get_db_connection():
+    """Checks out a raw psycopg2 connection from the shared engine's pool."""
+    engine = get_sql_engine()
+    if engine is None:
+        return None
+
+    try:
+        conn = engine.raw_connection()
+        print("Database connection successful!")
+        return conn
+    except Exception as e:
+        print(f"Could not connect to the database: {e}")
+        return None
@@ -1,37 +1,22 @@
 import os
+import ijson
+from concurrent.futures import ThreadPoolExecutor
 import requests
-import psycopg2
+from psycopg2.extras import execute_values
 import pandas as pd
 from dotenv import load_dotenv
 
+from db import get_db_connection
+
 # Load environment variables from the .env file in the project root
 load_dotenv()
 
 
-def get_db_connection():
-    """Establishes a connection to the PostgreSQL database."""
-    try:
-        # Load the password securely from the environment
-        db_password = os.getenv("DB_PASSWORD")
-        if not db_password:
-            raise ValueError("DB_PASSWORD not found in .env file!")
-
-        conn = psycopg2.connect(
-            dbname="energy_db",
-            user="postgres",
-            password=db_password,  # Use the variable here
-            host="localhost",
-            port="5432",
-        )
-        print("Database connection successful!")
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"Could not connect to the database: {e}")
-        return None
-
-
 def fetch_eia_data(api_key):
-    """Fetches hourly electricity demand data from the EIA API."""
+    """Fetches hourly electricity demand data from the EIA API.
+
+    Returns a tuple of two parallel lists: period strings and demand values.
+    """
     series_id = "EBA.US48-ALL.D.H"
     url = (
         f"https://api.eia.gov/v2/seriesid/{series_id}"
@@ -44,16 +29,45 @@ def fetch_eia_data(api_key):
     )
 
     print("Fetching data from EIA API...")
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        print("API request successful!")
-        data = response.json()
-        return data["response"]["data"]
-    else:
-        print(f"Failed to fetch data from API. Status Code: {response.status_code}")
-        print(f"Response: {response.text}")
-        return None
+    # With stream=True the connection stays checked out until the response
+    # is closed, so close it on both the success and the error path.
+    with requests.get(url, stream=True) as response:
+        if response.status_code == 200:
+            print("API request successful!")
+            # Stream-parse the body row by row instead of building the whole
+            # JSON tree with response.json(). We only keep the two fields we need.
+            response.raw.decode_content = True
+            periods_str, values = [], []
+            for row in ijson.items(response.raw, "response.data.item", use_float=True):
+                periods_str.append(row["period"])
+                values.append(row["value"])
+
+            if not periods_str:
+                return None
+            return periods_str, values
+        else:
+            print(f"Failed to fetch data from API. Status Code: {response.status_code}")
+            print(f"Response: {response.text}")
+            return None
+
+
+def prepare_table():
+    """Connects to the database and makes sure the raw_demand table exists."""
+    conn = get_db_connection()
+    if conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS raw_demand (
+                timestamp TIMESTAMPTZ PRIMARY KEY,
+                demand_mwh INT
+            );
+        """
+        )
+        conn.commit()
+        cur.close()
+        print("Table 'raw_demand' is ready.")
+    return conn
 
 
 if __name__ == "__main__":
@@ -61,36 +75,39 @@ if __name__ == "__main__":
     if not api_key:
         raise ValueError("EIA_API_KEY not found in .env file!")
 
-    eia_data = fetch_eia_data(api_key)
+    # The API request spends most of its time waiting on the network, so we
+    # connect and create the table in a background thread in the meantime.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        conn_future = executor.submit(prepare_table)
+        eia_data = fetch_eia_data(api_key)
+        conn = conn_future.result()
 
-    if eia_data:
-        conn = get_db_connection()
-        if conn:
+    if conn:
+        if eia_data:
+            periods_str, values = eia_data
             cur = conn.cursor()
 
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS raw_demand (
-                    timestamp TIMESTAMPTZ PRIMARY KEY,
-                    demand_mwh INT
-                );
-            """
-            )
-            print("Table 'raw_demand' is ready.")
-
+            # execute_values sends one multi-row INSERT per page instead of
+            # one round-trip per row like executemany does.
+            # RETURNING lets us count the inserted rows across all pages.
             insert_query = """
                 INSERT INTO raw_demand (timestamp, demand_mwh)
-                VALUES (%s, %s)
-                 ON CONFLICT (timestamp) DO NOTHING;
+                VALUES %s
+                ON CONFLICT (timestamp) DO NOTHING
+                RETURNING timestamp;
             """
-            data_to_insert = [
-                (pd.to_datetime(row["period"]), row["value"]) for row in eia_data
-            ]
-
-            cur.executemany(insert_query, data_to_insert)
+            # Parse every period in one vectorized call instead of once per row
+            periods = pd.to_datetime(periods_str, format="ISO8601", cache=True)
+            # zip() yields the rows lazily, and execute_values only pulls one
+            # page of them at a time, so no full list of tuples is built.
+            data_to_insert = zip(periods.to_pydatetime(), values)
+
+            inserted = execute_values(
+                cur, insert_query, data_to_insert, page_size=1000, fetch=True
+            )
             conn.commit()
 
-            print(f"Successfully inserted/updated {cur.rowcount} records.")
+            print(f"Successfully inserted/updated {len(inserted)} records.")
 
             cur.close()
-            conn.close()
+        conn.close()
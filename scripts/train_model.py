@@ -1,43 +1,141 @@
 import os
+import sys
+import json
+import hashlib
+import numpy as np
 import pandas as pd
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from urllib.parse import quote_plus
+from sqlalchemy import text
 
 # New imports for Machine Learning
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.metrics import mean_absolute_error
 import joblib
 
+from db import get_sql_engine
 
-# Load environment variables
-load_dotenv()
+# Local columnar copy of the features_demand table
+FEATURES_CACHE = "features_demand.parquet"
 
+MODEL_FILENAME = "demand_forecaster.joblib"
+# Records what the saved model was trained on, so unchanged inputs can skip training
+META_FILENAME = "demand_forecaster.meta"
 
-def get_sql_engine():
-    """Establishes a SQLAlchemy engine connection to the PostgreSQL database."""
+# Calendar features fit in int16, and the trees don't need float64 precision
+INT_COLUMNS = ("hour", "day_of_week", "day_of_year", "month", "year")
+FLOAT_COLUMNS = (
+    "demand_mwh",
+    "lag_demand_24h",
+    "lag_demand_1_week",
+    "rolling_mean_24h",
+)
+
+
+def get_table_stats(engine):
+    """Returns the newest timestamp and the row count of features_demand."""
+    sql_query = text("SELECT MAX(timestamp), COUNT(*) FROM features_demand;")
+    with engine.connect() as conn:
+        latest_ts, row_count = conn.execute(sql_query).one()
+    return latest_ts, row_count
+
+
+def load_cached_features():
+    """Loads the Parquet copy of the features, if there is one."""
+    if not os.path.exists(FEATURES_CACHE):
+        return None
+
+    # A broken cache (e.g. a half-written file) is just a cache miss, so
+    # we fall back to the database instead of failing the whole run.
     try:
-        db_password = os.getenv("DB_PASSWORD")
-        if not db_password:
-            raise ValueError("DB_PASSWORD not found in .env file!")
-
-        safe_password = quote_plus(db_password)
-        db_url = f"postgresql://postgres:{safe_password}" "@localhost:5432/energy_db"
-        engine = create_engine(db_url)
-        return engine
+        df = pd.read_parquet(FEATURES_CACHE, dtype_backend="pyarrow")
     except Exception as e:
-        print(f"Could not create database engine: {e}")
+        print(f"Could not read cache '{FEATURES_CACHE}': {e}")
+        return None
+    if df.empty:
+        return None
+
+    # Only a timestamp index can be compared with the database's timestamps.
+    # Caches written before timestamps were parsed explicitly may have a
+    # string index instead, so reload those from scratch. We check the
+    # dtype, since pandas 2.x only recognises an Arrow-backed timestamp
+    # index as datetime when given its dtype.
+    if not pd.api.types.is_datetime64_any_dtype(df.index.dtype):
+        print(f"Cache '{FEATURES_CACHE}' has no timestamp index. Ignoring it.")
         return None
+    return df
+
+
+def save_cached_features(df):
+    """Writes the Parquet copy of the features, replacing the old one atomically."""
+    # Write to a temporary file first so a crash mid-write never leaves a
+    # truncated cache behind.
+    tmp_path = f"{FEATURES_CACHE}.tmp"
+    df.to_parquet(tmp_path, compression="zstd")
+    os.replace(tmp_path, FEATURES_CACHE)
+
+
+def read_features_sql(engine, since=None):
+    """Reads rows from features_demand, optionally only those newer than 'since'."""
+    # We want to make sure the data is sorted by time
+    if since is None:
+        sql_query = text("SELECT * FROM features_demand ORDER BY timestamp;")
+        params = {}
+    else:
+        sql_query = text(
+            "SELECT * FROM features_demand"
+            " WHERE timestamp > :since ORDER BY timestamp;"
+        )
+        params = {"since": since.to_pydatetime()}
+
+    # Stream the rows in chunks of Arrow-backed columns instead of
+    # building one big frame of boxed Python objects.
+    # Timestamps are parsed explicitly as UTC: if the session timezone
+    # observes DST the rows come back with mixed UTC offsets, which would
+    # otherwise leave 'timestamp' as a string column.
+    chunks = pd.read_sql_query(
+        sql_query,
+        engine,
+        params=params,
+        parse_dates={"timestamp": {"utc": True}},
+        chunksize=50_000,
+        dtype_backend="pyarrow",
+    )
+    df = pd.concat(chunks, ignore_index=True)
+    df.set_index("timestamp", inplace=True)
+    return df
 
 
 def load_features_data(engine):
     """Loads all data from the features_demand table into a Pandas DataFrame."""
     print("Loading data from 'features_demand' table...")
     try:
-        # We want to make sure the data is sorted by time
-        sql_query = "SELECT * FROM features_demand ORDER BY timestamp;"
-        df = pd.read_sql_query(sql_query, engine, index_col="timestamp")
+        # The features only change when transform_data.py runs, and rows
+        # are only ever added at the end, so the cache is still valid for
+        # everything up to its newest timestamp.
+        latest_ts, row_count = get_table_stats(engine)
+        df = load_cached_features()
+
+        if df is not None and latest_ts is not None:
+            cached_ts = df.index.max()
+            if cached_ts == latest_ts and len(df) == row_count:
+                print(f"Successfully loaded {len(df)} records from '{FEATURES_CACHE}'.")
+                return df
+
+            if cached_ts < latest_ts:
+                # Only fetch the rows added since the cache was written
+                new_rows = read_features_sql(engine, since=cached_ts)
+                print(f"Loaded {len(new_rows)} new records since {cached_ts}.")
+                df = pd.concat([df, new_rows])
+                if len(df) == row_count:
+                    save_cached_features(df)
+                    print(f"Successfully loaded {len(df)} records.")
+                    return df
+
+            # Older rows changed too, so the cache can't be patched
+            print(f"Cache '{FEATURES_CACHE}' is stale. Reloading all records.")
+
+        df = read_features_sql(engine)
+        if not df.empty:
+            save_cached_features(df)
 
         print(f"Successfully loaded {len(df)} records.")
         return df
@@ -46,6 +144,64 @@ def load_features_data(engine):
         return None
 
 
+def downcast_features(df):
+    """Downcasts the feature columns to int16/float32 to halve memory use."""
+    for col in INT_COLUMNS:
+        df[col] = df[col].astype("int16")
+    for col in FLOAT_COLUMNS:
+        df[col] = df[col].astype("float32")
+    return df
+
+
+def build_model():
+    """Creates the (unfitted) forecasting model."""
+    # Features are bucketed into at most 255 bins, so each split is a
+    # cheap histogram scan instead of a sort over every value.
+    # Early stopping holds out 10% of the training data and stops
+    # adding trees once the validation score stops improving.
+    # 'random_state=42' ensures our model is reproducible.
+    return HistGradientBoostingRegressor(
+        max_iter=300,
+        learning_rate=0.05,
+        max_bins=255,
+        early_stopping=True,
+        validation_fraction=0.1,
+        random_state=42,
+    )
+
+
+def build_model_meta(model, features_hash):
+    """Describes what a model is trained on and how it is configured."""
+    meta = {
+        "features_hash": features_hash,
+        "model": type(model).__name__,
+        "params": model.get_params(),
+    }
+    # Round-trip through JSON so the dict compares equal to the one
+    # loaded back from the meta file (e.g. tuples become lists).
+    return json.loads(json.dumps(meta, default=str))
+
+
+def hash_features(df):
+    """Returns a hash of the DataFrame's contents, including the index."""
+    row_hashes = pd.util.hash_pandas_object(df).values
+    return hashlib.blake2b(row_hashes.tobytes()).hexdigest()
+
+
+def load_model_meta():
+    """Loads the metadata saved alongside the last trained model, if any."""
+    if not (os.path.exists(MODEL_FILENAME) and os.path.exists(META_FILENAME)):
+        return {}
+    with open(META_FILENAME) as f:
+        return json.load(f)
+
+
+def save_model_meta(meta):
+    """Saves metadata about the trained model next to the model file."""
+    with open(META_FILENAME, "w") as f:
+        json.dump(meta, f)
+
+
 if __name__ == "__main__":
     engine = get_sql_engine()
     if engine:
@@ -54,6 +210,16 @@ if __name__ == "__main__":
 
         if features_df is not None and not features_df.empty:
             print("\n--- Feature data successfully loaded. ---")
+            features_df = downcast_features(features_df)
+
+            # Training is deterministic, so if neither the features nor the
+            # model config changed since the last run, the saved model is
+            # already up to date.
+            model = build_model()
+            meta = build_model_meta(model, hash_features(features_df))
+            if load_model_meta() == meta:
+                print("Features and model unchanged since the last run. Exiting.")
+                sys.exit(0)
 
             # 2. Define Features (X) and Target (y)
             # The target is what we want to predict: 'demand_mwh'
@@ -64,24 +230,23 @@ if __name__ == "__main__":
             # 'axis=1' means we are dropping a column
             features = features_df.drop(target, axis=1)
 
-            X = features
-            y = features_df[target]
+            # Plain float32 arrays let sklearn skip its internal float64 copy
+            X = features.to_numpy(dtype=np.float32)
+            y = features_df[target].to_numpy()
 
             # 3. Split data into Training and Testing sets
-            # We use 20% of the data for testing.
-            # We MUST set shuffle=False for time-series data!
-            X_train, X_test, y_train, y_test = train_test_split(
-                X, y, test_size=0.2, shuffle=False
-            )
+            # We use the last 20% of the data for testing.
+            # We MUST NOT shuffle time-series data, so a plain slice is all
+            # we need. Slicing the arrays gives views rather than copies.
+            cut = int(len(X) * 0.8)
+            X_train, X_test = X[:cut], X[cut:]
+            y_train, y_test = y[:cut], y[cut:]
 
             print(f"Training data shape: {X_train.shape}")
             print(f"Testing data shape: {X_test.shape}")
 
             # 4. Train a Model
-            print("\nTraining RandomForestRegressor model...")
-            # We use 'n_estimators=100' (100 trees) as a good baseline.
-            # 'random_state=42' ensures our model is reproducible.
-            model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=-1)
+            print(f"\nTraining {type(model).__name__} model...")
             model.fit(X_train, y_train)
             print("Model training complete.")
 
@@ -97,9 +262,10 @@ if __name__ == "__main__":
             print(f"Model R-squared (R2) score: {r2:.2f}")
 
             # 6. Save (serialize) the trained model
-            model_filename = "demand_forecaster.joblib"
-            print(f"\nSaving model to {model_filename}...")
-            joblib.dump(model, model_filename)
+            # lz4 keeps the file small while staying fast to write and read.
+            print(f"\nSaving model to {MODEL_FILENAME}...")
+            joblib.dump(model, MODEL_FILENAME, compress=("lz4", 3))
+            save_model_meta(meta)
             print("Model saved successfully.")
 
         else:
@@ -1,143 +1,113 @@
-import os
 import pandas as pd
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from urllib.parse import quote_plus  # <-- 1. IMPORT THE NEW TOOL
-
-# Load environment variables
-load_dotenv()
-
-
-def get_sql_engine():
-    """Establishes a SQLAlchemy engine connection to the PostgreSQL database."""
-    try:
-        db_password = os.getenv("DB_PASSWORD")
-        if not db_password:
-            raise ValueError("DB_PASSWORD not found in .env file!")
-
-        # <-- 2. ENCODE THE PASSWORD FOR SAFETY -->
-        safe_password = quote_plus(db_password)
-
-        # Create a connection "engine" using a database URL
-        db_url = (
-            f"postgresql://postgres:{safe_password}"  # <-- USE THE SAFE PASSWORD
-            "@localhost:5432/energy_db"
-        )
-
-        engine = create_engine(db_url)
-        print("Database connection engine created successfully!")
-        return engine
-
-    except Exception as e:
-        print(f"Could not create database engine: {e}")
-        return None
-
-
-def load_raw_data(engine):
-    """Loads all data from the raw_demand table into a Pandas DataFrame."""
-    print("Loading data from 'raw_demand' table...")
+from sqlalchemy import text
+
+from db import get_sql_engine
+
+# The features table is created once with an explicit schema and then
+# refilled on every run, instead of being dropped and re-inferred.
+CREATE_FEATURES_TABLE = """
+    CREATE TABLE IF NOT EXISTS features_demand (
+        timestamp TIMESTAMPTZ PRIMARY KEY,
+        demand_mwh INT,
+        hour INT,
+        day_of_week INT,
+        day_of_year INT,
+        month INT,
+        year INT,
+        lag_demand_24h DOUBLE PRECISION,
+        lag_demand_1_week DOUBLE PRECISION,
+        rolling_mean_24h DOUBLE PRECISION
+    );
+"""
+
+# All cleaning and feature engineering runs inside PostgreSQL, so the raw
+# rows never have to be pulled into pandas and written back again.
+FEATURES_QUERY = """
+    INSERT INTO features_demand (
+        timestamp, demand_mwh, hour, day_of_week, day_of_year, month, year,
+        lag_demand_24h, lag_demand_1_week, rolling_mean_24h
+    )
+    WITH filled AS (
+        -- Each row joins the group of the last non-NULL demand before it,
+        -- which lets us forward fill missing values below.
+        SELECT
+            timestamp,
+            demand_mwh,
+            COUNT(demand_mwh) OVER (ORDER BY timestamp) AS fill_group
+        FROM raw_demand
+    ),
+    cleaned AS (
+        SELECT
+            timestamp,
+            FIRST_VALUE(demand_mwh) OVER (
+                PARTITION BY fill_group ORDER BY timestamp
+            ) AS demand_mwh
+        FROM filled
+    ),
+    features AS (
+        SELECT
+            timestamp,
+            demand_mwh,
+            -- Time-based features, computed in UTC
+            EXTRACT(hour FROM timestamp AT TIME ZONE 'UTC')::int AS hour,
+            -- ISODOW is Monday=1, so subtract 1 to get Monday=0, Sunday=6
+            (EXTRACT(isodow FROM timestamp AT TIME ZONE 'UTC') - 1)::int
+                AS day_of_week,
+            EXTRACT(doy FROM timestamp AT TIME ZONE 'UTC')::int AS day_of_year,
+            EXTRACT(month FROM timestamp AT TIME ZONE 'UTC')::int AS month,
+            EXTRACT(year FROM timestamp AT TIME ZONE 'UTC')::int AS year,
+            -- Lag features: demand 24 hours ago and 1 week ago
+            (LAG(demand_mwh, 24) OVER w)::double precision AS lag_demand_24h,
+            (LAG(demand_mwh, 24 * 7) OVER w)::double precision AS lag_demand_1_week,
+            -- Rolling average of the previous 24 hours
+            AVG(demand_mwh) OVER (
+                ORDER BY timestamp ROWS BETWEEN 24 PRECEDING AND 1 PRECEDING
+            )::double precision AS rolling_mean_24h
+        FROM cleaned
+        WINDOW w AS (ORDER BY timestamp)
+    )
+    -- The first week of rows has no lag values, so we drop them
+    -- as we can't train a model on them.
+    SELECT *
+    FROM features
+    WHERE demand_mwh IS NOT NULL AND lag_demand_1_week IS NOT NULL;
+"""
+
+
+def transform_data(engine):
+    """Builds the 'features_demand' table from 'raw_demand' inside the database."""
+    print("Transforming data...")
     try:
-        sql_query = "SELECT * FROM raw_demand;"
-        df = pd.read_sql_query(sql_query, engine)
-
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df.set_index("timestamp", inplace=True)
-
-        # We should sort our data by time, from oldest to newest
-        df.sort_index(inplace=True)
-
-        print(f"Successfully loaded {len(df)} records.")
-        return df
+        # Run everything in one transaction so readers never see the
+        # table half-filled.
+        with engine.begin() as conn:
+            conn.execute(text(CREATE_FEATURES_TABLE))
+            conn.execute(text("TRUNCATE features_demand;"))
+            result = conn.execute(text(FEATURES_QUERY))
+
+        print(f"Successfully saved {result.rowcount} records to 'features_demand'.")
+        return result.rowcount
     except Exception as e:
-        print(f"Error loading data: {e}")
+        print(f"Error transforming data: {e}")
         return None
 
 
-def transform_data(df):
-    """Cleans and engineers features on the raw data DataFrame."""
-    print("Transforming data...")
-
-    # --- 1. Data Cleaning ---
-
-    # We already sorted the index in the load step, which is great.
-    # Let's check for any duplicate timestamps (should be handled by PRIMARY KEY, but good to check)
-    df = df[~df.index.duplicated(keep="first")]
-
-    # Check for missing values in 'demand_mwh'
-    if df["demand_mwh"].isnull().sum() > 0:
-        print(
-            f"Found {df['demand_mwh'].isnull().sum()} missing values. Filling with 'forward fill' method."
-        )
-        # ffill (forward fill) is a good choice for time series,
-        # it assumes the value was the same as the previous hour's.
-        df["demand_mwh"] = df["demand_mwh"].ffill()
-
-    # --- 2. Feature Engineering ---
-
-    # Create time-based features
-    # These give the model signals about time of day, week, etc.
-    df["hour"] = df.index.hour
-    df["day_of_week"] = df.index.dayofweek  # Monday=0, Sunday=6
-    df["day_of_year"] = df.index.dayofyear
-    df["month"] = df.index.month
-    df["year"] = df.index.year
-
-    # Create lag features
-    # This is one of the most important features for forecasting.
-    # What was the demand 24 hours ago? What was it 1 week ago?
-    df["lag_demand_24h"] = df["demand_mwh"].shift(24)
-    df["lag_demand_1_week"] = df["demand_mwh"].shift(24 * 7)
-
-    # We'll also create a rolling average
-    df["rolling_mean_24h"] = df["demand_mwh"].shift(1).rolling(window=24).mean()
-
-    # After creating lag/rolling features, we will have NaNs at the start.
-    # It's best to drop these rows as we can't train a model on them.
-    df = df.dropna()
-
-    print(f"Data transformed. New shape: {df.shape}")
-    return df
-
-
-def save_features_data(df, engine):
-    """Saves the transformed DataFrame to a new table 'features_demand'."""
-    print("Saving data to 'features_demand' table...")
-    try:
-        # Use df.to_sql to create/replace the table
-        # 'if_exists='replace'' means it will drop the table if it already exists and create a new one.
-        # This is useful during development.
-        df.to_sql(
-            "features_demand",
-            engine,
-            if_exists="replace",
-            index=True,
-            index_label="timestamp",
-        )
-        print(f"Successfully saved {len(df)} records to 'features_demand'.")
-    except Exception as e:
-        print(f"Error saving data: {e}")
+def load_features_preview(engine, limit=5):
+    """Loads the first few rows of the features_demand table for a quick check."""
+    sql_query = text("SELECT * FROM features_demand ORDER BY timestamp LIMIT :limit;")
+    return pd.read_sql_query(
+        sql_query, engine, index_col="timestamp", params={"limit": limit}
+    )
 
 
 if __name__ == "__main__":
     engine = get_sql_engine()
     if engine:
-        # 1. Load the raw data
-        raw_df = load_raw_data(engine)
-
-        if raw_df is not None:
-            print("\n--- Raw data loaded. Here's a preview: ---")
-            print(raw_df.head())
-
-            # 2. Transform the data
-            transformed_df = transform_data(raw_df)
-
-            if transformed_df is not None and not transformed_df.empty:
-                print("\n--- Data transformed. Here's a preview: ---")
-                print(transformed_df.head())
+        # 1. Build the features table from the raw data
+        row_count = transform_data(engine)
 
-                # 3. Save the new features data
-                save_features_data(transformed_df, engine)
-            else:
-                print("Data transformation failed or resulted in an empty DataFrame.")
+        if row_count:
+            print("\n--- Data transformed. Here's a preview: ---")
+            print(load_features_preview(engine))
         else:
-            print("Data loading failed.")
+            print("Data transformation failed or resulted in an empty table.")